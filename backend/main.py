@@ -1,6 +1,24 @@
 # backend/main.py
+import os
+import json
+import math
+import threading
+import sqlite3
+import atexit
+import tempfile
+import time
+import random
+import hmac
+import re
+import cProfile
+import pstats
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import OrderedDict
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from pathlib import Path
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from datetime import date, datetime, timedelta
 import pandas as pd
@@ -36,6 +54,7 @@ class AnalysisRequest(BaseModel):
     lat: float
     lon: float
     target_date: str
+    exact: bool = False  # skip interpolation from neighbouring cached cells
 
 class GeocodeRequest(BaseModel):
     query: str
@@ -60,51 +79,285 @@ LOCAL_ALIAS = {
 }
 
 # ------------------------------------------------------------------
-# 5.  NASA-POWER  helpers  (unchanged for daily stats)
+# 5.  LOCAL DATA STORE  (pre-ingested upstream data, see warm_cache.py)
 # ------------------------------------------------------------------
-def fetch_nasa_power_data(lat: float, lon: float, target_day_of_year: int):
-    start_year, end_year = 2005, 2024
+STORE_DIR = Path(os.getenv("WEATHER_STORE_DIR", Path(__file__).resolve().parent / "data_store"))
+POWER_START_YEAR, POWER_END_YEAR = 2005, 2024
+POWER_PARAMETERS = ["T2M_MAX", "T2M_MIN", "PRECTOTCORR", "WS10M", "RH2M", "PS"]
+POWER_VALUE_COLUMNS = [
+    "temperature_2m_max",
+    "temperature_2m_min",
+    "precipitation_sum",
+    "wind_speed_10m_max",
+    "relative_humidity_2m_mean",
+    "surface_pressure",
+]
+POWER_FILL_VALUE = -999.0
+# MERRA-2 grid used by POWER for its meteorological parameters
+POWER_LAT_STEP, POWER_LON_STEP = 0.5, 0.625
+HOURLY_STORE_STEP = 0.1
+HOURLY_VARIABLES = "temperature_2m,relative_humidity_2m,precipitation,wind_speed_10m,surface_pressure,cloud_cover"
+
+_store_lock = threading.Lock()
+
+def power_cell(lat: float, lon: float):
+    """Snap a point to the centre of the POWER grid cell containing it."""
+    cell_lat = round(round(lat / POWER_LAT_STEP) * POWER_LAT_STEP, 4)
+    cell_lon = round(round(lon / POWER_LON_STEP) * POWER_LON_STEP, 4)
+    # +180 and -180 are the same cell; keep one store file for it
+    cell_lon = round((cell_lon + 180.0) % 360.0 - 180.0, 4)
+    return cell_lat, cell_lon
+
+def hourly_cell(lat: float, lon: float):
+    cell_lat = round(round(lat / HOURLY_STORE_STEP) * HOURLY_STORE_STEP, 4)
+    cell_lon = round(round(lon / HOURLY_STORE_STEP) * HOURLY_STORE_STEP, 4)
+    return cell_lat, cell_lon
+
+def _cell_name(lat: float, lon: float):
+    return f"{lat:+.4f}_{lon:+.4f}"
+
+def _power_daily_path(lat: float, lon: float):
+    return STORE_DIR / "power_daily" / f"{_cell_name(*power_cell(lat, lon))}.pkl"
+
+def _hourly_year_path(lat: float, lon: float, year: int):
+    return STORE_DIR / "hourly" / _cell_name(*hourly_cell(lat, lon)) / f"{year}.pkl"
+
+def _write_frame(df: pd.DataFrame, path: Path):
+    # Write-then-rename so a reader (or an interrupted warmer) never sees half a
+    # file; the temp name is unique so the server and the warmer never collide
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.stem, suffix=".tmp")
+    os.close(fd)
+    try:
+        df.to_pickle(tmp_name)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+def _read_frame(path: Path):
+    if not path.exists():
+        return None
+    try:
+        return pd.read_pickle(path)
+    except Exception:
+        return None
+
+def has_power_daily(lat: float, lon: float):
+    return _power_daily_path(lat, lon).exists()
+
+def load_stored_power_daily(lat: float, lon: float):
+    return _read_frame(_power_daily_path(lat, lon))
+
+def store_power_daily(lat: float, lon: float, df: pd.DataFrame):
+    _write_frame(df, _power_daily_path(lat, lon))
+
+def has_hourly_year(lat: float, lon: float, year: int):
+    return _hourly_year_path(lat, lon, year).exists()
+
+def load_stored_hourly_year(lat: float, lon: float, year: int):
+    return _read_frame(_hourly_year_path(lat, lon, year))
+
+def store_hourly_year(lat: float, lon: float, year: int, df: pd.DataFrame):
+    _write_frame(df, _hourly_year_path(lat, lon, year))
+
+# Request counts are buffered in memory and merged into sqlite with atomic
+# increments, so the hot path never touches disk and workers don't lose counts
+REQUEST_COUNT_FLUSH_SECONDS = float(os.getenv("REQUEST_COUNT_FLUSH_SECONDS", "30"))
+_pending_counts = {}
+_last_count_flush = time.monotonic()
+
+def _request_count_db():
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(STORE_DIR / "request_counts.sqlite", timeout=10)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS request_counts "
+        "(lat REAL NOT NULL, lon REAL NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (lat, lon))"
+    )
+    return conn
+
+def record_cell_request(lat: float, lon: float):
+    """Count analysis requests per hourly-store cell so the warmer can target the busiest ones."""
+    with _store_lock:
+        key = hourly_cell(lat, lon)
+        _pending_counts[key] = _pending_counts.get(key, 0) + 1
+        due = time.monotonic() - _last_count_flush >= REQUEST_COUNT_FLUSH_SECONDS
+    if due:
+        flush_request_counts()
+
+def flush_request_counts():
+    global _last_count_flush
+    with _store_lock:
+        pending = dict(_pending_counts)
+        _pending_counts.clear()
+        _last_count_flush = time.monotonic()
+    if not pending:
+        return
+    try:
+        conn = _request_count_db()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO request_counts (lat, lon, count) VALUES (?, ?, ?) "
+                    "ON CONFLICT (lat, lon) DO UPDATE SET count = count + excluded.count",
+                    [(lat, lon, count) for (lat, lon), count in pending.items()],
+                )
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"Error flushing request counts: {e}")
+        # Keep the counts for the next flush
+        with _store_lock:
+            for key, count in pending.items():
+                _pending_counts[key] = _pending_counts.get(key, 0) + count
+
+atexit.register(flush_request_counts)
+
+def top_requested_cells(n: int):
+    flush_request_counts()
+    if not (STORE_DIR / "request_counts.sqlite").exists():
+        return []
+    conn = _request_count_db()
+    try:
+        rows = conn.execute("SELECT lat, lon FROM request_counts ORDER BY count DESC LIMIT ?", (n,)).fetchall()
+    finally:
+        conn.close()
+    return [(lat, lon) for lat, lon in rows]
+
+# ------------------------------------------------------------------
+# 5A. NASA-POWER  helpers  (unchanged for daily stats)
+# ------------------------------------------------------------------
+def power_daily_frame(params_data: dict):
+    """Build the full daily DataFrame from a POWER "parameter" block."""
+    date_keys = list(params_data.get("T2M_MAX", {}).keys())
+    if not date_keys:
+        return None
+    df_data = {
+        "time": [datetime.strptime(d, "%Y%m%d") for d in date_keys],
+        "temperature_2m_max": [params_data.get("T2M_MAX", {}).get(d) for d in date_keys],
+        "temperature_2m_min": [params_data.get("T2M_MIN", {}).get(d) for d in date_keys],
+        "precipitation_sum": [params_data.get("PRECTOTCORR", {}).get(d) for d in date_keys],
+        "wind_speed_10m_max": [params_data.get("WS10M", {}).get(d) for d in date_keys],
+        "relative_humidity_2m_mean": [params_data.get("RH2M", {}).get(d) for d in date_keys],
+        "surface_pressure": [params_data.get("PS", {}).get(d) for d in date_keys],
+    }
+    df = pd.DataFrame(df_data)
+    # POWER marks missing days with a fill value rather than null
+    df[POWER_VALUE_COLUMNS] = df[POWER_VALUE_COLUMNS].astype(float).replace(POWER_FILL_VALUE, np.nan)
+    df = df.dropna(subset=["temperature_2m_max"])
+    if len(df) == 0:
+        return None
+    return _with_derived_columns(df).reset_index(drop=True)
+
+def _with_derived_columns(df: pd.DataFrame):
+    df["temperature_2m_mean"] = (df["temperature_2m_max"] + df["temperature_2m_min"]) / 2
+    df["day_of_year"] = df["time"].dt.dayofyear
+    df["year"] = df["time"].dt.year
+    return df
+
+def download_power_daily(lat: float, lon: float):
     url = "https://power.larc.nasa.gov/api/temporal/daily/point"
     params = {
-        "parameters": "T2M_MAX,T2M_MIN,PRECTOTCORR,WS10M,RH2M,PS",
+        "parameters": ",".join(POWER_PARAMETERS),
         "community": "RE",
         "longitude": lon,
         "latitude": lat,
-        "start": f"{start_year}0101",
-        "end": f"{end_year}1231",
+        "start": f"{POWER_START_YEAR}0101",
+        "end": f"{POWER_END_YEAR}1231",
         "format": "JSON",
     }
+    response = requests.get(url, params=params, timeout=90)
+    response.raise_for_status()
+    data = response.json()
+    if "properties" not in data or "parameter" not in data["properties"]:
+        return None
+    return power_daily_frame(data["properties"]["parameter"])
+
+def load_power_daily(lat: float, lon: float):
+    """Full daily series for the cell, from the local store when it has been ingested."""
+    df = load_stored_power_daily(lat, lon)
+    if df is not None:
+        return df
+    df = download_power_daily(lat, lon)
+    if df is not None:
+        # The store is only a cache; a failed write must not lose the download
+        try:
+            store_power_daily(lat, lon, df)
+        except Exception as e:
+            print(f"Error storing daily data: {e}")
+    return df
+
+def power_neighbours(lat: float, lon: float):
+    """The POWER cell centres bracketing a point, with their bilinear weights."""
+    lat0 = math.floor(lat / POWER_LAT_STEP) * POWER_LAT_STEP
+    lon0 = math.floor(lon / POWER_LON_STEP) * POWER_LON_STEP
+    ty = (lat - lat0) / POWER_LAT_STEP
+    tx = (lon - lon0) / POWER_LON_STEP
+    lat1, lon1 = lat0 + POWER_LAT_STEP, lon0 + POWER_LON_STEP
+    corners = [
+        ((lat0, lon0), (1 - ty) * (1 - tx)),
+        ((lat0, lon1), (1 - ty) * tx),
+        ((lat1, lon0), ty * (1 - tx)),
+        ((lat1, lon1), ty * tx),
+    ]
+    # A point on a grid line or centre only needs the corners it actually touches
+    return [(power_cell(*corner), weight) for corner, weight in corners if weight > 1e-9]
+
+def interpolate_power_daily(lat: float, lon: float):
+    """
+    Bilinear blend of the stored daily series around the point.
+    Returns None unless every bracketing cell is already in the local store.
+    """
+    neighbours = power_neighbours(lat, lon)
+    if not all(has_power_daily(*cell) for cell, _ in neighbours):
+        return None
+    frames = [load_stored_power_daily(*cell) for cell, _ in neighbours]
+    if any(frame is None for frame in frames):
+        return None
+    
+    frames = [frame.set_index("time") for frame in frames]
+    times = frames[0].index
+    for frame in frames[1:]:
+        times = times.intersection(frame.index)
+    if len(times) == 0:
+        return None
+    
+    # (neighbours, days, columns); missing values drop out of the weighting
+    values = np.stack([frame.loc[times, POWER_VALUE_COLUMNS].to_numpy(dtype=float) for frame in frames])
+    present = ~np.isnan(values)
+    weights = np.array([weight for _, weight in neighbours])[:, None, None] * present
+    weight_sum = weights.sum(axis=0)
+    blended = np.divide(
+        (np.where(present, values, 0.0) * weights).sum(axis=0),
+        weight_sum,
+        out=np.full(weight_sum.shape, np.nan),
+        where=weight_sum > 0,
+    )
+    
+    df = pd.DataFrame(blended, columns=POWER_VALUE_COLUMNS)
+    df.insert(0, "time", times)
+    df = df.dropna(subset=["temperature_2m_max"])
+    if len(df) == 0:
+        return None
+    return _with_derived_columns(df).reset_index(drop=True)
+
+def fetch_nasa_power_data(lat: float, lon: float, target_day_of_year: int, exact: bool = False):
     try:
-        response = requests.get(url, params=params, timeout=90)
-        if response.status_code != 200:
-            return None
-        data = response.json()
-        if "properties" not in data or "parameter" not in data["properties"]:
+        # Serve from neighbouring cached cells when possible; go upstream only
+        # when one is missing or the caller asked for the exact cell
+        df = None if exact else interpolate_power_daily(lat, lon)
+        source = "interpolated" if df is not None else "cell"
+        if df is None:
+            df = load_power_daily(lat, lon)
+        if df is None:
             return None
-        params_data = data["properties"]["parameter"]
-        date_keys = list(params_data.get("T2M_MAX", {}).keys())
-        if not date_keys:
-            return None
-        df_data = {
-            "time": [datetime.strptime(d, "%Y%m%d") for d in date_keys],
-            "temperature_2m_max": [params_data.get("T2M_MAX", {}).get(d) for d in date_keys],
-            "temperature_2m_min": [params_data.get("T2M_MIN", {}).get(d) for d in date_keys],
-            "precipitation_sum": [params_data.get("PRECTOTCORR", {}).get(d) for d in date_keys],
-            "wind_speed_10m_max": [params_data.get("WS10M", {}).get(d) for d in date_keys],
-            "relative_humidity_2m_mean": [params_data.get("RH2M", {}).get(d) for d in date_keys],
-            "surface_pressure": [params_data.get("PS", {}).get(d) for d in date_keys],
-        }
-        df = pd.DataFrame(df_data).dropna(subset=["temperature_2m_max"])
-        if len(df) == 0:
-            return None
-        df["temperature_2m_mean"] = (df["temperature_2m_max"] + df["temperature_2m_min"]) / 2
-        df["day_of_year"] = df["time"].dt.dayofyear
-        df["year"] = df["time"].dt.year
         filtered_df = df[df["day_of_year"].between(target_day_of_year - 3, target_day_of_year + 3)].copy()
         if len(filtered_df) < 20:
             return None
         filtered_df["rain_binary"] = (filtered_df["precipitation_sum"].fillna(0) >= 1.0).astype(int)
-        return filtered_df.reset_index(drop=True)
+        filtered_df = filtered_df.reset_index(drop=True)
+        filtered_df.attrs["source"] = source
+        return filtered_df
     except Exception:
         return None
 
@@ -243,6 +496,43 @@ def determine_season(month: int, lat: float, lon: float):
 # ------------------------------------------------------------------
 # 5C. PREDICTIVE HOURLY MODEL using historical same-date patterns
 # ------------------------------------------------------------------
+def download_hourly_range(lat: float, lon: float, start_date: date, end_date: date):
+    """Fetch hourly Open-Meteo archive data for an inclusive date range; raises on HTTP errors."""
+    url = "https://archive-api.open-meteo.com/v1/archive"
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "start_date": start_date.strftime("%Y-%m-%d"),
+        "end_date": end_date.strftime("%Y-%m-%d"),
+        "hourly": HOURLY_VARIABLES,
+        "timezone": "auto"
+    }
+    
+    response = requests.get(url, params=params, timeout=30)
+    response.raise_for_status()
+        
+    data = response.json()
+    if "hourly" not in data:
+        return None
+        
+    hourly = data["hourly"]
+    return pd.DataFrame({
+        "datetime": pd.to_datetime(hourly["time"]),
+        "temperature": hourly["temperature_2m"],
+        "humidity": hourly["relative_humidity_2m"],
+        "precipitation": hourly["precipitation"],
+        "wind_speed": hourly["wind_speed_10m"],
+        "pressure": hourly["surface_pressure"],
+        "cloud_cover": hourly["cloud_cover"]
+    })
+
+def load_hourly_day(lat: float, lon: float, day: date):
+    """One day of hourly data, sliced from a year the cache warmer stored or fetched from Open-Meteo."""
+    stored = load_stored_hourly_year(lat, lon, day.year)
+    if stored is not None:
+        return stored[stored["datetime"].dt.date == day].reset_index(drop=True)
+    return download_hourly_range(lat, lon, day, day)
+
 def fetch_historical_hourly_data(lat: float, lon: float, target_date: date, years_back: int = 20):
     """
     Fetch hourly data for the same date across previous years.
@@ -266,37 +556,14 @@ def fetch_historical_hourly_data(lat: float, lon: float, target_date: date, year
             if historical_date > today:
                 continue
             
-            # Fetch from Open-Meteo Archive API
-            url = "https://archive-api.open-meteo.com/v1/archive"
-            params = {
-                "latitude": lat,
-                "longitude": lon,
-                "start_date": historical_date.strftime("%Y-%m-%d"),
-                "end_date": historical_date.strftime("%Y-%m-%d"),
-                "hourly": "temperature_2m,relative_humidity_2m,precipitation,wind_speed_10m,surface_pressure,cloud_cover",
-                "timezone": "auto"
-            }
-            
-            response = requests.get(url, params=params, timeout=30)
-            if response.status_code != 200:
+            try:
+                df = load_hourly_day(lat, lon, historical_date)
+            except requests.RequestException:
                 continue
-                
-            data = response.json()
-            if "hourly" not in data:
+            if df is None or len(df) == 0:
                 continue
-                
-            hourly = data["hourly"]
-            df = pd.DataFrame({
-                "datetime": pd.to_datetime(hourly["time"]),
-                "year": historical_year,
-                "temperature": hourly["temperature_2m"],
-                "humidity": hourly["relative_humidity_2m"],
-                "precipitation": hourly["precipitation"],
-                "wind_speed": hourly["wind_speed_10m"],
-                "pressure": hourly["surface_pressure"],
-                "cloud_cover": hourly["cloud_cover"]
-            })
             
+            df["year"] = historical_year
             df["hour"] = df["datetime"].dt.hour
             df["year_offset"] = year_offset  # For weighting
             
@@ -373,17 +640,27 @@ def predict_future_hourly(lat: float, lon: float, target_date: date):
     Predict hourly weather for a future date using historical patterns.
     """
     try:
-        # Fetch historical data for the same date in previous years
-        historical_df = fetch_historical_hourly_data(lat, lon, target_date, years_back=20)
-        
-        if historical_df is None or len(historical_df) < 50:
-            return None
-        
-        # Train the model
-        model, scaler = train_hourly_prediction_model(historical_df)
+        def build():
+            # Fetch historical data for the same date in previous years
+            with profile_stage("hourly_history_fetch"):
+                historical_df = fetch_historical_hourly_data(lat, lon, target_date, years_back=20)
+            
+            if historical_df is None or len(historical_df) < 50:
+                return None
+            
+            # Train the model
+            with profile_stage("hourly_model_train"):
+                model, scaler = train_hourly_prediction_model(historical_df)
+            
+            if model is None or scaler is None:
+                return None
+            
+            return compile_tree_ensemble(model, scaler), historical_df["year"].nunique()
         
-        if model is None or scaler is None:
+        cached = cached_model(("hourly",) + hourly_cell(lat, lon) + (target_date,), build)
+        if cached is None:
             return None
+        model, years_used = cached
         
         # Create prediction features for each hour of target date
         hours = list(range(24))
@@ -397,9 +674,8 @@ def predict_future_hourly(lat: float, lon: float, target_date: date):
             "cos_doy": [np.cos(2 * np.pi * target_date.timetuple().tm_yday / 366)] * 24,
         })
         
-        # Scale and predict
-        prediction_features_scaled = scaler.transform(prediction_features)
-        predictions = model.predict(prediction_features_scaled)
+        # Scaling is folded into the compiled model's thresholds
+        predictions = model.predict(prediction_features.to_numpy(dtype=float))
         
         # Format results
         hourly_data = []
@@ -423,7 +699,7 @@ def predict_future_hourly(lat: float, lon: float, target_date: date):
             "hourly_data": hourly_data,
             "season": season,
             "prediction_method": "ML (Gradient Boosting with Exponential Decay)",
-            "years_used": len(historical_df["year"].unique())
+            "years_used": years_used
         }
         
     except Exception as e:
@@ -435,38 +711,24 @@ def fetch_actual_hourly_data(lat: float, lon: float, target_date: date):
     Fetch actual historical hourly data for past dates.
     """
     try:
-        url = "https://archive-api.open-meteo.com/v1/archive"
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "start_date": target_date.strftime("%Y-%m-%d"),
-            "end_date": target_date.strftime("%Y-%m-%d"),
-            "hourly": "temperature_2m,relative_humidity_2m,precipitation,wind_speed_10m,surface_pressure,cloud_cover",
-            "timezone": "auto"
-        }
-        
-        response = requests.get(url, params=params, timeout=30)
-        if response.status_code != 200:
+        df = load_hourly_day(lat, lon, target_date)
+        if df is None or len(df) == 0:
             return None
             
-        data = response.json()
-        if "hourly" not in data:
-            return None
-            
-        hourly = data["hourly"]
-        hourly_data = []
+        def value(v, digits):
+            return round(float(v), digits) if pd.notna(v) else None
         
-        for i in range(len(hourly["time"])):
-            dt = pd.to_datetime(hourly["time"][i])
+        hourly_data = []
+        for row in df.itertuples(index=False):
             hourly_data.append({
-                "hour": dt.hour,
-                "time": dt.strftime("%Y-%m-%d %H:%M"),
-                "temperature": round(hourly["temperature_2m"][i], 1) if hourly["temperature_2m"][i] is not None else None,
-                "humidity": round(hourly["relative_humidity_2m"][i], 1) if hourly["relative_humidity_2m"][i] is not None else None,
-                "precipitation": round(hourly["precipitation"][i], 2) if hourly["precipitation"][i] is not None else 0,
-                "wind_speed": round(hourly["wind_speed_10m"][i], 1) if hourly["wind_speed_10m"][i] is not None else None,
-                "pressure": round(hourly["surface_pressure"][i], 1) if hourly["surface_pressure"][i] is not None else None,
-                "cloud_cover": int(hourly["cloud_cover"][i]) if hourly["cloud_cover"][i] is not None else None,
+                "hour": row.datetime.hour,
+                "time": row.datetime.strftime("%Y-%m-%d %H:%M"),
+                "temperature": value(row.temperature, 1),
+                "humidity": value(row.humidity, 1),
+                "precipitation": value(row.precipitation, 2) if pd.notna(row.precipitation) else 0,
+                "wind_speed": value(row.wind_speed, 1),
+                "pressure": value(row.pressure, 1),
+                "cloud_cover": int(row.cloud_cover) if pd.notna(row.cloud_cover) else None,
                 "predicted": False
             })
         
@@ -519,15 +781,22 @@ def calculate_weather_statistics(df: pd.DataFrame, target_date: date):
     stats = {}
     weights = (df["year"] - df["year"].min() + 1).values
     stats["temp_max_mean"] = np.average(df["temperature_2m_max"], weights=weights)
-    stats["avg_precipitation"] = np.average(df["precipitation_sum"], weights=weights)
+    # Missing (fill-value) precipitation days are left out rather than counted as zero
+    has_precip = df["precipitation_sum"].notna().values
+    precip_df = df[has_precip]
+    stats["avg_precipitation"] = (
+        np.average(precip_df["precipitation_sum"], weights=weights[has_precip]) if has_precip.any() else 0.0
+    )
     stats["prob_rain"] = (df["precipitation_sum"] >= 1.0).sum() / len(df) * 100
     years_to_project = target_date.year - df["year"].max()
     if years_to_project > 0 and len(df["year"].unique()) > 1:
         temp_fit = np.polyfit(df["year"], df["temperature_2m_max"], 1)
         stats["temp_trend_per_year"] = temp_fit[0]
         stats["projected_temp_max"] = stats["temp_max_mean"] + (stats["temp_trend_per_year"] * years_to_project)
-        precip_fit = np.polyfit(df["year"], df["precipitation_sum"], 1)
-        stats["precip_trend_per_year"] = precip_fit[0]
+        if precip_df["year"].nunique() > 1:
+            stats["precip_trend_per_year"] = np.polyfit(precip_df["year"], precip_df["precipitation_sum"], 1)[0]
+        else:
+            stats["precip_trend_per_year"] = 0
         stats["projected_precip"] = stats["avg_precipitation"] + (stats["precip_trend_per_year"] * years_to_project)
     else:
         stats.update(
@@ -540,24 +809,40 @@ def calculate_weather_statistics(df: pd.DataFrame, target_date: date):
         )
     return stats
 
-def analyze_location_weather(lat: float, lon: float, target_date: date):
+def analyze_location_weather(lat: float, lon: float, target_date: date, exact: bool = False):
+    record_cell_request(lat, lon)
+    
     # Fetch NASA POWER daily data (for long-term trends and ML)
-    df = fetch_nasa_power_data(lat, lon, target_date.timetuple().tm_yday)
+    with profile_stage("daily_fetch"):
+        df = fetch_nasa_power_data(lat, lon, target_date.timetuple().tm_yday, exact=exact)
     if df is None:
         return {"error": "Insufficient data from NASA. This could be an ocean area or a temporary API issue."}
     
     # Calculate daily statistics
-    stats = calculate_weather_statistics(df, target_date)
-    model, scaler, cv_score = train_model(df)
+    with profile_stage("daily_stats"):
+        stats = calculate_weather_statistics(df, target_date)
+    
+    def build():
+        with profile_stage("rain_model_train"):
+            model, scaler, cv_score = train_model(df)
+        if model is None:
+            return None
+        return compile_tree_ensemble(model, scaler), cv_score
     
-    if model:
+    # Interpolated series are unique to the point, cell series are shared by the whole cell
+    source = df.attrs.get("source", "cell")
+    location_key = (round(lat, 4), round(lon, 4)) if source == "interpolated" else power_cell(lat, lon)
+    with profile_stage("rain_model"):
+        cached = cached_model(("rain", source) + location_key + (target_date.timetuple().tm_yday,), build)
+    
+    if cached:
+        model, cv_score = cached
         stats["model_accuracy"] = cv_score * 100
         future_row = df.iloc[[-1]].copy()
         future_row["year"] = target_date.year
         features = create_features(future_row)
         if not features.isna().any().any():
-            features_scaled = scaler.transform(features)
-            stats["ml_rain_probability"] = model.predict_proba(features_scaled)[0, 1] * 100
+            stats["ml_rain_probability"] = model.predict(features.to_numpy(dtype=float))[0, 1] * 100
             stats["prediction_method"] = "ML (Trend-Aware)"
         else:
             stats.update({"ml_rain_probability": stats["prob_rain"], "prediction_method": "Historical Frequency"})
@@ -567,17 +852,19 @@ def analyze_location_weather(lat: float, lon: float, target_date: date):
     # Determine if date is past or future
     today = date.today()
     
-    if target_date <= today:
-        # Past date - fetch actual historical data
-        hourly_result = fetch_actual_hourly_data(lat, lon, target_date)
-    else:
-        # Future date - use predictive model
-        hourly_result = predict_future_hourly(lat, lon, target_date)
+    with profile_stage("hourly"):
+        if target_date <= today:
+            # Past date - fetch actual historical data
+            hourly_result = fetch_actual_hourly_data(lat, lon, target_date)
+        else:
+            # Future date - use predictive model
+            hourly_result = predict_future_hourly(lat, lon, target_date)
     
     # Prepare daily historical data for response
-    df_json = df.to_dict(orient="records")
-    for row in df_json:
-        row["time"] = row["time"].isoformat()
+    with profile_stage("serialize"):
+        df_json = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+        for row in df_json:
+            row["time"] = row["time"].isoformat()
     
     response = {
         "error": None,
@@ -585,7 +872,8 @@ def analyze_location_weather(lat: float, lon: float, target_date: date):
         "lon": lon,
         "df": df_json,
         "stats": stats,
-        "total_years": df["year"].nunique()
+        "total_years": df["year"].nunique(),
+        "data_source": source
     }
     
     if hourly_result:
@@ -596,6 +884,245 @@ def analyze_location_weather(lat: float, lon: float, target_date: date):
     
     return response
 
+# ------------------------------------------------------------------
+# 5D. COMPACT TREE ENSEMBLES  (flat-array inference + model cache)
+# ------------------------------------------------------------------
+# Byte budget for compiled models (an hourly model is roughly 1 MB, a rain model 0.2 MB)
+MODEL_CACHE_BYTES = int(os.getenv("MODEL_CACHE_MB", "256")) * 1024 * 1024
+
+_model_cache = OrderedDict()
+_model_cache_bytes = 0
+_model_cache_lock = threading.Lock()
+
+class CompactTreeEnsemble:
+    """
+    A fitted tree ensemble flattened into contiguous node arrays.
+    All trees share one node table; leaves point at themselves with an
+    infinite threshold, so every row can walk `depth` steps in lock-step.
+    The training StandardScaler is folded into the thresholds, so `predict`
+    takes raw (unscaled) features.
+    """
+
+    def __init__(self, roots, feature, threshold, left, right, value, output_map, bias, depth):
+        self.roots = roots            # (n_trees,) index of each tree's root node
+        self.feature = feature        # (n_nodes,) split feature
+        self.threshold = threshold    # (n_nodes,) go left when x[feature] <= threshold
+        self.left = left              # (n_nodes,) left child
+        self.right = right            # (n_nodes,) right child
+        self.value = value            # (n_nodes, width) leaf contribution
+        self.output_map = output_map  # (n_trees * width, n_outputs) leaf value -> output column
+        self.bias = bias              # (n_outputs,) constant term
+        self.depth = depth
+
+    def predict(self, X: np.ndarray):
+        X = np.asarray(X, dtype=np.float64)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        leaf_values = self.value[node].reshape(len(X), -1)
+        return self.bias + leaf_values @ self.output_map
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.roots, self.feature, self.threshold, self.left,
+                                       self.right, self.value, self.output_map, self.bias))
+
+def _float32_split_edge(threshold: np.ndarray):
+    """
+    sklearn compares float32(x) <= threshold; return the float64 cut point
+    with the same outcome, i.e. the upper edge of the float32 rounding
+    bucket that still lands on the left of the split.
+    """
+    below = threshold.astype(np.float32)
+    below = np.where(below > threshold, np.nextafter(below, np.float32(-np.inf)), below)
+    above = np.nextafter(below, np.float32(np.inf))
+    return (below.astype(np.float64) + above.astype(np.float64)) / 2
+
+def compile_tree_ensemble(model, scaler: StandardScaler = None):
+    """
+    Flatten a fitted RandomForestClassifier (outputs class probabilities) or
+    MultiOutputRegressor(GradientBoostingRegressor) (outputs the regression
+    targets) into a CompactTreeEnsemble.
+    """
+    if isinstance(model, RandomForestClassifier):
+        n_outputs = len(model.classes_)
+        bias = np.zeros(n_outputs)
+        trees = []
+        for est in model.estimators_:
+            value = est.tree_.value[:, 0, :]
+            value = value / np.maximum(value.sum(axis=1, keepdims=True), 1e-12)
+            trees.append((est.tree_, value / len(model.estimators_)))
+        # Every tree votes on every class
+        output_map = np.tile(np.eye(n_outputs), (len(trees), 1))
+    elif isinstance(model, MultiOutputRegressor):
+        n_outputs = len(model.estimators_)
+        bias = np.zeros(n_outputs)
+        trees, columns = [], []
+        for k, gbr in enumerate(model.estimators_):
+            if gbr.init_ != "zero":
+                bias[k] = gbr.init_.predict(np.zeros((1, gbr.n_features_in_))).ravel()[0]
+            for est in gbr.estimators_[:, 0]:
+                trees.append((est.tree_, est.tree_.value[:, 0, :] * gbr.learning_rate))
+                columns.append(k)
+        # Each tree only contributes to the target its booster was fitted on
+        output_map = np.eye(n_outputs)[columns]
+    else:
+        raise TypeError(f"Cannot compile {type(model).__name__}")
+
+    if scaler is not None:
+        mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(scaler.n_features_in_)
+        scale = scaler.scale_ if scaler.scale_ is not None else np.ones(scaler.n_features_in_)
+    else:
+        mean = scale = None
+
+    roots, feature, threshold, left, right, value = [], [], [], [], [], []
+    offset = 0
+    for tree, tree_value in trees:
+        n = tree.node_count
+        is_leaf = tree.children_left == -1
+        own = np.arange(offset, offset + n)
+        tree_feature = np.where(is_leaf, 0, tree.feature)
+        tree_threshold = _float32_split_edge(tree.threshold)
+        if scaler is not None:
+            # (x - mean) / scale <= t  <=>  x <= t * scale + mean   (scale > 0)
+            tree_threshold = tree_threshold * scale[tree_feature] + mean[tree_feature]
+        roots.append(offset)
+        feature.append(tree_feature)
+        threshold.append(np.where(is_leaf, np.inf, tree_threshold))
+        left.append(np.where(is_leaf, own, tree.children_left + offset))
+        right.append(np.where(is_leaf, own, tree.children_right + offset))
+        value.append(tree_value)
+        offset += n
+
+    return CompactTreeEnsemble(
+        roots=np.array(roots, dtype=np.int32),
+        feature=np.concatenate(feature).astype(np.int32),
+        threshold=np.concatenate(threshold),
+        left=np.concatenate(left).astype(np.int32),
+        right=np.concatenate(right).astype(np.int32),
+        value=np.ascontiguousarray(np.concatenate(value)),
+        output_map=output_map,
+        bias=bias,
+        depth=max(tree.max_depth for tree, _ in trees),
+    )
+
+def cached_model(key: tuple, build):
+    """
+    LRU cache for compiled models, bounded by MODEL_CACHE_BYTES. `build`
+    returns a tuple whose first item is the CompactTreeEnsemble, or None
+    when no model could be trained (which is not cached).
+    """
+    global _model_cache_bytes
+    with _model_cache_lock:
+        if key in _model_cache:
+            _model_cache.move_to_end(key)
+            return _model_cache[key]
+    value = build()
+    if value is not None:
+        with _model_cache_lock:
+            if key not in _model_cache:
+                _model_cache[key] = value
+                _model_cache_bytes += value[0].nbytes
+            while _model_cache_bytes > MODEL_CACHE_BYTES and _model_cache:
+                _, evicted = _model_cache.popitem(last=False)
+                _model_cache_bytes -= evicted[0].nbytes
+    return value
+
+# ------------------------------------------------------------------
+# 5E. REQUEST PROFILING  (opt-in, see /profiles endpoints)
+# ------------------------------------------------------------------
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", Path(__file__).resolve().parent / "profiles"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_ID_PATTERN = re.compile(r"^[0-9A-Za-z_.+-]+$")
+
+_stage_timings = ContextVar("stage_timings", default=None)
+# cProfile cannot nest, so only one request is profiled at a time
+_profile_lock = threading.Lock()
+
+@contextmanager
+def profile_stage(name: str):
+    """Time a pipeline stage; free when the request is not being profiled."""
+    timings = _stage_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+def is_profile_token(token: str):
+    # Compare bytes: compare_digest rejects non-ASCII str, and headers arrive as latin-1
+    return bool(PROFILE_TOKEN and token and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()))
+
+def should_profile(token: str = None):
+    if is_profile_token(token):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def run_profiled(fn, tags: dict, **kwargs):
+    """Run `fn(**kwargs)` under cProfile and save the capture with `tags` and stage timings."""
+    if not _profile_lock.acquire(blocking=False):
+        return fn(**kwargs)
+    timings = {}
+    context_token = _stage_timings.set(timings)
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    error = None
+    try:
+        return profiler.runcall(fn, **kwargs)
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        total = time.perf_counter() - start
+        _stage_timings.reset(context_token)
+        try:
+            save_profile(profiler, tags, timings, total, error)
+        except Exception as e:
+            print(f"Error saving profile: {e}")
+        finally:
+            _profile_lock.release()
+
+def save_profile(profiler: cProfile.Profile, tags: dict, timings: dict, total: float, error: str = None):
+    """
+    Write <id>.prof (pstats, viewable as a flamegraph with snakeviz or
+    flameprof), <id>.txt (top functions) and <id>.json (metadata).
+    """
+    created = datetime.utcnow()
+    capture_id = "{}_{:+.4f}_{:+.4f}_{}".format(
+        created.strftime("%Y%m%dT%H%M%S%f"), tags["lat"], tags["lon"], tags["target_date"]
+    )
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(PROFILE_DIR / f"{capture_id}.prof")
+    with open(PROFILE_DIR / f"{capture_id}.txt", "w") as summary:
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(40)
+    metadata = {
+        "id": capture_id,
+        "created": created.isoformat() + "Z",
+        **tags,
+        "total_seconds": round(total, 4),
+        "stages": {name: round(seconds, 4) for name, seconds in timings.items()},
+        "error": error,
+    }
+    (PROFILE_DIR / f"{capture_id}.json").write_text(json.dumps(metadata, indent=2))
+    
+    # Keep only the most recent captures
+    for old in sorted(PROFILE_DIR.glob("*.json"), reverse=True)[PROFILE_KEEP:]:
+        for suffix in (".json", ".prof", ".txt"):
+            old.with_suffix(suffix).unlink(missing_ok=True)
+
+def list_profiles(limit: int):
+    if not PROFILE_DIR.exists():
+        return []
+    paths = sorted(PROFILE_DIR.glob("*.json"), reverse=True)[:limit]
+    return [json.loads(path.read_text()) for path in paths]
+
 # ------------------------------------------------------------------
 # 6.  Extra utility endpoints
 # ------------------------------------------------------------------
@@ -711,16 +1238,42 @@ async def handle_reverse_geocode_request(request: ReverseGeocodeRequest):
 # 8.  Analysis endpoint
 # ------------------------------------------------------------------
 @app.post("/analyze")
-async def handle_analysis_request(request: AnalysisRequest):
+async def handle_analysis_request(request: AnalysisRequest, x_profile_token: str = Header(None)):
     try:
         target_date_obj = datetime.strptime(request.target_date, "%Y-%m-%d").date()
-        results = analyze_location_weather(lat=request.lat, lon=request.lon, target_date=target_date_obj)
+        kwargs = {"lat": request.lat, "lon": request.lon, "target_date": target_date_obj, "exact": request.exact}
+        if should_profile(x_profile_token):
+            tags = {"lat": request.lat, "lon": request.lon, "target_date": request.target_date}
+            results = run_profiled(analyze_location_weather, tags, **kwargs)
+        else:
+            results = analyze_location_weather(**kwargs)
         if results.get("error"):
             raise HTTPException(status_code=404, detail=results["error"])
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ------------------------------------------------------------------
+# 8A. Profiling endpoints  (require the X-Profile-Token header)
+# ------------------------------------------------------------------
+def require_profile_token(token: str):
+    if not is_profile_token(token):
+        raise HTTPException(status_code=403, detail="Profiling is not enabled for this token.")
+
+@app.get("/profiles")
+def handle_list_profiles(limit: int = Query(20, ge=1, le=200), x_profile_token: str = Header(None)):
+    require_profile_token(x_profile_token)
+    return {"profiles": list_profiles(limit)}
+
+@app.get("/profiles/{capture_id}")
+def handle_download_profile(capture_id: str, format: str = Query("prof", pattern="^(prof|txt|json)$"),
+                            x_profile_token: str = Header(None)):
+    require_profile_token(x_profile_token)
+    path = PROFILE_DIR / f"{capture_id}.{format}"
+    if not PROFILE_ID_PATTERN.match(capture_id) or not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(path, filename=path.name)
+
 # ------------------------------------------------------------------
 # 9.  Entrypoint
 # ------------------------------------------------------------------
@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# main.py lives in backend/, which is not a package
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# Keep anything written at import or exit time out of the source tree
+_scratch = tempfile.mkdtemp(prefix="weather_tests_")
+os.environ.setdefault("WEATHER_STORE_DIR", os.path.join(_scratch, "store"))
+os.environ.setdefault("PROFILE_DIR", os.path.join(_scratch, "profiles"))
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    """Point the local data store (and the warmer's checkpoints) at a fresh directory."""
+    import main
+    import warm_cache
+
+    monkeypatch.setattr(main, "STORE_DIR", tmp_path)
+    monkeypatch.setattr(warm_cache, "STORE_DIR", tmp_path)
+    return tmp_path
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestClassifier
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.preprocessing import StandardScaler
+
+from main import compile_tree_ensemble
+
+
+def make_features(rng, n):
+    # Integer-valued columns (hour, year) land exactly on split points, which
+    # is where the float32 threshold folding goes wrong if it breaks
+    return np.column_stack([
+        rng.integers(0, 24, n),
+        rng.integers(2004, 2024, n),
+        rng.normal(25, 5, n),
+        rng.uniform(900, 1020, n),
+    ]).astype(float)
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(42)
+
+
+def test_random_forest_matches_predict_proba(rng):
+    X = make_features(rng, 400)
+    y = (X[:, 2] + rng.normal(0, 3, len(X)) > 25).astype(int)
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=20, max_depth=10, random_state=0).fit(scaler.transform(X), y)
+
+    compact = compile_tree_ensemble(model, scaler)
+
+    X_new = np.vstack([X, make_features(rng, 200)])
+    expected = model.predict_proba(scaler.transform(X_new))
+    np.testing.assert_allclose(compact.predict(X_new), expected, rtol=0, atol=1e-9)
+
+
+def test_weighted_multioutput_gradient_boosting_matches_predict(rng):
+    X = make_features(rng, 400)
+    Y = np.column_stack([X[:, 2] + X[:, 0] * 0.3, X[:, 3] / 10, rng.normal(0, 1, len(X))])
+    weights = 0.9 ** rng.integers(1, 21, len(X))
+    scaler = StandardScaler().fit(X)
+    model = MultiOutputRegressor(
+        GradientBoostingRegressor(n_estimators=30, max_depth=5, learning_rate=0.1, random_state=0)
+    ).fit(scaler.transform(X), Y, sample_weight=weights)
+
+    compact = compile_tree_ensemble(model, scaler)
+
+    X_new = np.vstack([X, make_features(rng, 200)])
+    expected = model.predict(scaler.transform(X_new))
+    np.testing.assert_allclose(compact.predict(X_new), expected, rtol=0, atol=1e-9)
+
+
+def test_unsupported_model_raises():
+    with pytest.raises(TypeError):
+        compile_tree_ensemble(object())
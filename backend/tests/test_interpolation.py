@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from main import (
+    POWER_LAT_STEP,
+    POWER_LON_STEP,
+    POWER_PARAMETERS,
+    has_power_daily,
+    interpolate_power_daily,
+    power_cell,
+    power_daily_frame,
+    power_neighbours,
+    store_power_daily,
+)
+
+
+def store_constant_cell(lat, lon, value, dates=None, **overrides):
+    dates = dates if dates is not None else pd.date_range("2020-01-01", "2020-01-10")
+    params = {p: {d.strftime("%Y%m%d"): overrides.get(p, value) for d in dates} for p in POWER_PARAMETERS}
+    store_power_daily(lat, lon, power_daily_frame(params))
+
+
+@pytest.mark.parametrize("lat, lon", [(10.6, 75.7), (-10.6, -75.7), (-0.1, -0.2), (45.49, 179.9)])
+def test_weights_sum_to_one_and_bracket_the_point(lat, lon):
+    neighbours = power_neighbours(lat, lon)
+    assert sum(weight for _, weight in neighbours) == pytest.approx(1.0)
+    assert len(neighbours) == 4
+    for (cell_lat, cell_lon), _ in neighbours:
+        assert abs(cell_lat - lat) <= POWER_LAT_STEP
+        # Compare around the dateline by wrapping the difference
+        assert abs((cell_lon - lon + 180) % 360 - 180) <= POWER_LON_STEP
+
+
+def test_negative_coordinates_floor_towards_minus_infinity():
+    cells = {cell for cell, _ in power_neighbours(-10.6, -75.7)}
+    assert cells == {(-11.0, -76.25), (-11.0, -75.625), (-10.5, -76.25), (-10.5, -75.625)}
+
+
+def test_weights_collapse_on_grid_lines():
+    assert power_neighbours(11.0, 76.25) == [((11.0, 76.25), pytest.approx(1.0))]
+    on_lat_line = power_neighbours(11.0, 76.5)
+    assert {cell for cell, _ in on_lat_line} == {(11.0, 76.25), (11.0, 76.875)}
+
+
+def test_dateline_is_a_single_cell():
+    assert power_cell(0.0, 180.0) == power_cell(0.0, -180.0) == (0.0, -180.0)
+    assert power_cell(0.0, 179.9) == (0.0, -180.0)
+
+
+def test_dateline_neighbours_hit_the_store(store_dir):
+    for lat in (0.0, 0.5):
+        store_constant_cell(lat, 179.375, 1.0)
+        store_constant_cell(lat, -180.0, 3.0)
+
+    df = interpolate_power_daily(0.25, 179.6875)
+
+    assert df is not None
+    np.testing.assert_allclose(df["temperature_2m_max"], 2.0)
+
+
+def test_bilinear_blend(store_dir):
+    corners = {(10.5, 75.625): 0.0, (10.5, 76.25): 10.0, (11.0, 75.625): 20.0, (11.0, 76.25): 30.0}
+    for (lat, lon), value in corners.items():
+        store_constant_cell(lat, lon, value)
+
+    df = interpolate_power_daily(10.6, 75.7)
+
+    # ty = 0.2, tx = 0.12
+    expected = 0.8 * 0.12 * 10 + 0.2 * 0.88 * 20 + 0.2 * 0.12 * 30
+    np.testing.assert_allclose(df["temperature_2m_max"], expected)
+    np.testing.assert_allclose(df["temperature_2m_mean"], expected)
+
+
+def test_missing_neighbour_returns_none(store_dir):
+    store_constant_cell(10.5, 75.625, 1.0)
+    store_constant_cell(10.5, 76.25, 1.0)
+    store_constant_cell(11.0, 75.625, 1.0)
+
+    assert not has_power_daily(11.0, 76.25)
+    assert interpolate_power_daily(10.6, 75.7) is None
+
+
+def test_nan_neighbour_is_renormalised_away(store_dir):
+    store_constant_cell(10.5, 75.625, 10.0)
+    store_constant_cell(10.5, 76.25, 20.0)
+    # Fill values become NaN in power_daily_frame
+    store_constant_cell(11.0, 75.625, 30.0, RH2M=-999.0)
+    store_constant_cell(11.0, 76.25, 40.0, RH2M=-999.0)
+
+    df = interpolate_power_daily(10.6, 75.7)
+
+    # Humidity only has the southern pair: weights 0.88 and 0.12 after renormalising
+    np.testing.assert_allclose(df["relative_humidity_2m_mean"], 0.88 * 10 + 0.12 * 20)
+    assert not df["temperature_2m_max"].isna().any()
+
+
+def test_series_are_intersected_on_time(store_dir):
+    full = pd.date_range("2020-01-01", "2020-01-10")
+    short = pd.date_range("2020-01-03", "2020-01-07")
+    store_constant_cell(10.5, 75.625, 1.0, full)
+    store_constant_cell(10.5, 76.25, 1.0, short)
+    store_constant_cell(11.0, 75.625, 1.0, full)
+    store_constant_cell(11.0, 76.25, 1.0, full)
+
+    df = interpolate_power_daily(10.6, 75.7)
+
+    assert list(df["time"]) == list(short)
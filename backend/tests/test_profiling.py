@@ -0,0 +1,100 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+TOKEN = "s3cret"
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "PROFILE_DIR", tmp_path)
+    monkeypatch.setattr(main, "PROFILE_TOKEN", TOKEN)
+    monkeypatch.setattr(main, "PROFILE_SAMPLE_RATE", 0.0)
+    return tmp_path
+
+
+@pytest.fixture
+def client(profile_dir):
+    return TestClient(main.app)
+
+
+def fake_analysis(lat, lon, target_date, exact=False):
+    with main.profile_stage("daily_fetch"):
+        sum(range(1000))
+    with main.profile_stage("rain_model"):
+        sum(range(1000))
+    return {"error": None, "lat": lat, "lon": lon}
+
+
+def analyze(client, headers=None, target_date="2026-04-10"):
+    return client.post(
+        "/analyze", json={"lat": 10.5, "lon": 76.25, "target_date": target_date}, headers=headers or {}
+    )
+
+
+def test_profiles_require_the_token(client):
+    assert client.get("/profiles").status_code == 403
+    assert client.get("/profiles", headers={"X-Profile-Token": "wrong"}).status_code == 403
+    assert client.get("/profiles/anything").status_code == 403
+
+
+def test_non_ascii_token_is_rejected_not_an_error(client):
+    headers = {"X-Profile-Token": "caf\xe9".encode("latin-1")}
+    assert client.get("/profiles", headers=headers).status_code == 403
+    assert main.is_profile_token("caf\xe9") is False
+
+
+def test_profiling_disabled_without_configured_token(client, monkeypatch):
+    monkeypatch.setattr(main, "PROFILE_TOKEN", None)
+    assert client.get("/profiles", headers={"X-Profile-Token": TOKEN}).status_code == 403
+
+
+def test_token_request_writes_capture_with_stage_timings(client, profile_dir, monkeypatch):
+    monkeypatch.setattr(main, "analyze_location_weather", fake_analysis)
+
+    assert analyze(client, {"X-Profile-Token": TOKEN}).status_code == 200
+
+    [meta_path] = profile_dir.glob("*.json")
+    meta = json.loads(meta_path.read_text())
+    assert (meta["lat"], meta["lon"], meta["target_date"]) == (10.5, 76.25, "2026-04-10")
+    assert set(meta["stages"]) == {"daily_fetch", "rain_model"}
+    assert meta["total_seconds"] >= sum(meta["stages"].values())
+    assert meta_path.with_suffix(".prof").exists()
+    assert meta_path.with_suffix(".txt").exists()
+
+    listed = client.get("/profiles", headers={"X-Profile-Token": TOKEN}).json()["profiles"]
+    assert [p["id"] for p in listed] == [meta["id"]]
+    download = client.get(f"/profiles/{meta['id']}", params={"format": "json"}, headers={"X-Profile-Token": TOKEN})
+    assert download.status_code == 200
+    assert download.json() == meta
+
+
+def test_unprofiled_request_writes_nothing(client, profile_dir, monkeypatch):
+    monkeypatch.setattr(main, "analyze_location_weather", fake_analysis)
+    assert analyze(client).status_code == 200
+    assert list(profile_dir.iterdir()) == []
+
+
+def test_download_rejects_bad_or_unknown_ids(client, profile_dir):
+    headers = {"X-Profile-Token": TOKEN}
+    # Exists on disk but does not match PROFILE_ID_PATTERN
+    (profile_dir / "bad id.prof").write_text("x")
+    assert client.get("/profiles/bad id", headers=headers).status_code == 404
+    assert client.get("/profiles/20260101T000000000000_missing", headers=headers).status_code == 404
+    assert client.get("/profiles/whatever", params={"format": "py"}, headers=headers).status_code == 422
+
+
+def test_old_captures_are_pruned(client, profile_dir, monkeypatch):
+    monkeypatch.setattr(main, "PROFILE_KEEP", 2)
+    monkeypatch.setattr(main, "analyze_location_weather", fake_analysis)
+
+    for day in ("2026-04-10", "2026-04-11", "2026-04-12"):
+        analyze(client, {"X-Profile-Token": TOKEN}, target_date=day)
+
+    kept = sorted(p.stem for p in profile_dir.glob("*.json"))
+    assert len(kept) == 2
+    assert [stem[-10:] for stem in kept] == ["2026-04-11", "2026-04-12"]
+    assert len(list(profile_dir.iterdir())) == 2 * 3
@@ -0,0 +1,191 @@
+import pandas as pd
+import pytest
+import requests
+
+import warm_cache
+from main import POWER_PARAMETERS, has_power_daily, power_cell, power_daily_frame
+from warm_cache import (
+    REGIONAL_MAX_SPAN,
+    REGIONAL_MIN_SPAN,
+    Checkpoint,
+    Throttle,
+    grid_cells,
+    hourly_cells,
+    ingest_power_region,
+    pad_tile,
+    region_tiles,
+    retry_after,
+)
+
+DATES = pd.date_range("2020-01-01", "2020-01-05")
+VALUES = {d.strftime("%Y%m%d"): 1.0 for d in DATES}
+
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(f"{status}", response=response)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(warm_cache.time, "sleep", recorded.append)
+    return recorded
+
+
+# ------------------------------------------------------------------
+# Tiles and grids
+# ------------------------------------------------------------------
+def test_region_tiles_cover_the_box_within_the_max_span():
+    tiles = region_tiles(0, 25, 70, 96)
+    assert len(tiles) == 3 * 3
+    assert all(t[1] - t[0] <= REGIONAL_MAX_SPAN and t[3] - t[2] <= REGIONAL_MAX_SPAN for t in tiles)
+    assert min(t[0] for t in tiles) == 0 and max(t[1] for t in tiles) == 25
+    assert min(t[2] for t in tiles) == 70 and max(t[3] for t in tiles) == 96
+
+
+def test_pad_tile_grows_around_the_centre():
+    assert pad_tile(0, 1, 70, 96) == (-0.5, 1.5, 70, 96)
+
+
+@pytest.mark.parametrize("tile, expected", [
+    ((89.5, 90, 10, 11), (88.0, 90.0, 9.5, 11.5)),
+    ((-90, -89.5, 10, 11), (-90.0, -88.0, 9.5, 11.5)),
+    ((0, 1, 179.5, 180), (-0.5, 1.5, 178.0, 180.0)),
+    ((0, 1, -180, -179), (-0.5, 1.5, -180.0, -178.0)),
+])
+def test_pad_tile_stays_inside_the_globe(tile, expected):
+    padded = pad_tile(*tile)
+    assert padded == expected
+    assert padded[1] - padded[0] >= REGIONAL_MIN_SPAN
+    assert padded[3] - padded[2] >= REGIONAL_MIN_SPAN
+
+
+def test_grid_cells_cover_every_point_in_the_box():
+    cells = set(grid_cells(8, 13, 74, 78))
+    for lat in (8.0, 8.2, 10.5, 13.0):
+        for lon in (74.0, 74.3, 76.0, 78.0):
+            assert power_cell(lat, lon) in cells
+
+
+def test_hourly_cells_use_the_fine_grid():
+    cells = hourly_cells(8, 9, 74, 75)
+    assert len(cells) == 11 * 11
+    assert (8.5, 74.3) in cells
+
+
+# ------------------------------------------------------------------
+# Regional ingestion
+# ------------------------------------------------------------------
+def test_region_fills_cells_the_regional_response_leaves_out(store_dir, monkeypatch, sleeps):
+    def regional(parameter, lat_min, lat_max, lon_min, lon_max):
+        # Only centres strictly inside the requested box, like POWER does
+        return {cell: VALUES for cell in grid_cells(lat_min, lat_max, lon_min, lon_max)
+                if lat_min <= cell[0] <= lat_max and lon_min <= cell[1] <= lon_max}
+
+    points = []
+
+    def point(lat, lon):
+        points.append((lat, lon))
+        return power_daily_frame({p: VALUES for p in POWER_PARAMETERS})
+
+    monkeypatch.setattr(warm_cache, "download_power_regional", regional)
+    monkeypatch.setattr(warm_cache, "download_power_daily", point)
+    checkpoint = Checkpoint("region")
+
+    ingest_power_region(8, 13, 74, 78, Throttle(0), checkpoint)
+
+    assert all(has_power_daily(*cell) for cell in grid_cells(8, 13, 74, 78))
+    assert has_power_daily(8.2, 74.0)
+    assert (8.0, 73.75) in points
+    assert "tile:8.0,13.0,74.0,78.0" in checkpoint
+
+
+def test_region_tile_not_marked_while_cells_are_missing(store_dir, monkeypatch, sleeps):
+    def regional(parameter, *tile):
+        # One parameter leaves out a cell, which cannot be fetched point-wise either
+        cells = grid_cells(*tile)
+        return {cell: VALUES for cell in cells if parameter != "PS" or cell != (10.5, 76.25)}
+
+    monkeypatch.setattr(warm_cache, "download_power_regional", regional)
+    monkeypatch.setattr(warm_cache, "download_power_daily", lambda lat, lon: None)
+    checkpoint = Checkpoint("region")
+
+    ingest_power_region(8, 13, 74, 78, Throttle(0), checkpoint)
+
+    assert not has_power_daily(10.5, 76.25)
+    assert "tile:8.0,13.0,74.0,78.0" not in checkpoint
+
+
+# ------------------------------------------------------------------
+# Throttle and checkpoints
+# ------------------------------------------------------------------
+def failing(error, calls):
+    def fn():
+        calls.append(1)
+        raise error
+    return fn
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_throttle_retries_rate_limits_and_server_errors(status, sleeps):
+    calls = []
+    assert Throttle(0, max_retries=2, backoff=1).call(failing(http_error(status), calls)) is None
+    assert len(calls) == 3
+    assert sleeps == [1, 2]
+
+
+@pytest.mark.parametrize("status", [400, 403, 404, 422])
+def test_throttle_fails_fast_on_client_errors(status, sleeps):
+    calls = []
+    assert Throttle(0).call(failing(http_error(status), calls)) is None
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_throttle_honours_retry_after(sleeps):
+    calls = []
+    Throttle(0, max_retries=1).call(failing(http_error(429, {"Retry-After": "7"}), calls))
+    assert sleeps == [7.0]
+
+
+def test_throttle_retries_network_errors_until_success(sleeps):
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise requests.ConnectionError("reset")
+        return "ok"
+
+    assert Throttle(0, backoff=5).call(flaky) == "ok"
+    assert sleeps == [5]
+
+
+def test_throttle_does_not_retry_empty_results(sleeps):
+    assert Throttle(0).call(lambda: None) is None
+    assert sleeps == []
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("12", 12.0),
+    ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),
+    ("soon", None),
+])
+def test_retry_after_parsing(value, expected):
+    assert retry_after(http_error(429, {"Retry-After": value}).response) == expected
+
+
+def test_checkpoint_survives_a_torn_last_line(store_dir):
+    checkpoint = Checkpoint("job")
+    checkpoint.mark("a")
+    with open(checkpoint.path, "a") as log:
+        log.write('"tor')
+
+    resumed = Checkpoint("job")
+    resumed.mark("b")
+
+    assert Checkpoint("job").done == {"a", "b"}
+    assert Checkpoint("job", restart=True).done == set()
@@ -0,0 +1,358 @@
+# backend/warm_cache.py
+"""
+Bulk pre-ingestion of NASA POWER daily data and Open-Meteo hourly data into
+the local data store used by main.py, so requests for warmed cells never
+have to wait on an upstream download.
+
+    python warm_cache.py region --lat-min 8 --lat-max 13 --lon-min 74 --lon-max 78
+    python warm_cache.py sites sites.csv --hourly
+    python warm_cache.py top --n 50 --hourly --every 24
+
+Progress is checkpointed under <store>/checkpoints, so an interrupted job
+picks up where it stopped when re-run with the same arguments.
+"""
+import argparse
+import json
+import math
+import os
+import time
+from datetime import date, datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import numpy as np
+import pandas as pd
+import requests
+
+from main import (
+    STORE_DIR,
+    POWER_START_YEAR,
+    POWER_END_YEAR,
+    POWER_PARAMETERS,
+    POWER_LAT_STEP,
+    POWER_LON_STEP,
+    power_cell,
+    hourly_cell,
+    HOURLY_STORE_STEP,
+    power_daily_frame,
+    download_power_daily,
+    download_hourly_range,
+    has_power_daily,
+    store_power_daily,
+    has_hourly_year,
+    store_hourly_year,
+    top_requested_cells,
+)
+
+# POWER only serves regional requests for boxes between 2 and 10 degrees a side
+REGIONAL_MIN_SPAN, REGIONAL_MAX_SPAN = 2.0, 10.0
+HOURLY_YEARS_BACK = 20
+
+# ------------------------------------------------------------------
+# 1.  Upstream rate limiting
+# ------------------------------------------------------------------
+class Throttle:
+    """
+    Keep at least `min_interval` seconds between upstream calls. Rate limits
+    (429), server errors and network errors are retried with backoff,
+    honouring Retry-After; anything else fails fast.
+    """
+
+    def __init__(self, min_interval: float, max_retries: int = 3, backoff: float = 30.0):
+        self.min_interval = min_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._last_call = 0.0
+
+    def wait(self):
+        delay = self._last_call + self.min_interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._last_call = time.monotonic()
+
+    def call(self, fn, *args, **kwargs):
+        """Run `fn` under the throttle; returns None when it fails for good."""
+        for attempt in range(self.max_retries + 1):
+            self.wait()
+            delay = None
+            try:
+                return fn(*args, **kwargs)
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status is None or (status != 429 and status < 500):
+                    print(f"Upstream error {status}, not retrying: {e}")
+                    return None
+                print(f"Upstream error {status}: {e}")
+                delay = retry_after(e.response)
+            except requests.RequestException as e:
+                print(f"Upstream error: {e}")
+            if attempt == self.max_retries:
+                return None
+            time.sleep(delay if delay is not None else self.backoff * 2 ** attempt)
+        return None
+
+def retry_after(response):
+    """Seconds requested by a Retry-After header (delta or HTTP date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+# ------------------------------------------------------------------
+# 2.  Checkpointing
+# ------------------------------------------------------------------
+class Checkpoint:
+    """
+    Set of finished work items (tiles, cells, hourly sites) for one job,
+    kept as an append-only JSON-lines log so each item costs one short write.
+    """
+
+    def __init__(self, job: str, restart: bool = False):
+        self.path = STORE_DIR / "checkpoints" / f"{job}.jsonl"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.done = set()
+        if restart:
+            self.path.unlink(missing_ok=True)
+        elif self.path.exists():
+            text = self.path.read_text()
+            for line in text.splitlines():
+                try:
+                    self.done.add(json.loads(line))
+                except ValueError:
+                    # A warmer killed mid-write leaves a partial last line
+                    continue
+            if text and not text.endswith("\n"):
+                with open(self.path, "a") as log:
+                    log.write("\n")
+
+    def __contains__(self, key: str):
+        return key in self.done
+
+    def mark(self, key: str):
+        if key in self.done:
+            return
+        self.done.add(key)
+        with open(self.path, "a") as log:
+            log.write(json.dumps(key) + "\n")
+
+# ------------------------------------------------------------------
+# 3.  Daily (NASA POWER) ingestion
+# ------------------------------------------------------------------
+def grid_cells(lat_min: float, lat_max: float, lon_min: float, lon_max: float):
+    """All POWER cell centres covering the bounding box."""
+    lats = np.arange(math.floor(lat_min / POWER_LAT_STEP), math.ceil(lat_max / POWER_LAT_STEP) + 1) * POWER_LAT_STEP
+    lons = np.arange(math.floor(lon_min / POWER_LON_STEP), math.ceil(lon_max / POWER_LON_STEP) + 1) * POWER_LON_STEP
+    return [power_cell(float(la), float(lo)) for la in lats if lat_min - POWER_LAT_STEP / 2 <= la <= lat_max + POWER_LAT_STEP / 2
+            for lo in lons if lon_min - POWER_LON_STEP / 2 <= lo <= lon_max + POWER_LON_STEP / 2]
+
+def region_tiles(lat_min: float, lat_max: float, lon_min: float, lon_max: float):
+    """Split a bounding box into tiles no larger than the regional endpoint accepts."""
+    lat_edges = np.linspace(lat_min, lat_max, max(1, math.ceil((lat_max - lat_min) / REGIONAL_MAX_SPAN)) + 1)
+    lon_edges = np.linspace(lon_min, lon_max, max(1, math.ceil((lon_max - lon_min) / REGIONAL_MAX_SPAN)) + 1)
+    return [(round(float(lat_edges[i]), 4), round(float(lat_edges[i + 1]), 4),
+             round(float(lon_edges[j]), 4), round(float(lon_edges[j + 1]), 4))
+            for i in range(len(lat_edges) - 1) for j in range(len(lon_edges) - 1)]
+
+def pad_tile(lat_min: float, lat_max: float, lon_min: float, lon_max: float):
+    """Grow a tile around its centre to the regional endpoint's minimum span."""
+    def pad(low, high, lower_bound, upper_bound):
+        extra = max(0.0, REGIONAL_MIN_SPAN - (high - low)) / 2
+        low, high = low - extra, high + extra
+        # Shift back inside the globe rather than shrinking below the minimum
+        if low < lower_bound:
+            low, high = lower_bound, high + (lower_bound - low)
+        if high > upper_bound:
+            low, high = low - (high - upper_bound), upper_bound
+        return round(low, 4), round(high, 4)
+
+    return (*pad(lat_min, lat_max, -90.0, 90.0), *pad(lon_min, lon_max, -180.0, 180.0))
+
+def download_power_regional(parameter: str, lat_min: float, lat_max: float, lon_min: float, lon_max: float):
+    """One parameter for every cell of a tile, as {(lat, lon): {YYYYMMDD: value}}."""
+    url = "https://power.larc.nasa.gov/api/temporal/daily/regional"
+    params = {
+        "parameters": parameter,
+        "community": "RE",
+        "latitude-min": lat_min,
+        "latitude-max": lat_max,
+        "longitude-min": lon_min,
+        "longitude-max": lon_max,
+        "start": f"{POWER_START_YEAR}0101",
+        "end": f"{POWER_END_YEAR}1231",
+        "format": "JSON",
+    }
+    response = requests.get(url, params=params, timeout=300)
+    response.raise_for_status()
+    features = response.json().get("features")
+    if not features:
+        return None
+    series = {}
+    for feature in features:
+        lon, lat = feature["geometry"]["coordinates"][:2]
+        series[power_cell(lat, lon)] = feature["properties"]["parameter"].get(parameter, {})
+    return series
+
+def ingest_power_cells(cells, throttle: Throttle, checkpoint: Checkpoint):
+    """Point-by-point fallback for cells the regional endpoint cannot cover."""
+    for lat, lon in cells:
+        key = f"daily:{lat},{lon}"
+        if key in checkpoint:
+            continue
+        if not has_power_daily(lat, lon):
+            df = throttle.call(download_power_daily, lat, lon)
+            if df is None:
+                print(f"No daily data for {lat},{lon}; will retry on the next run")
+                continue
+            store_power_daily(lat, lon, df)
+        checkpoint.mark(key)
+
+def ingest_power_region(lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+                        throttle: Throttle, checkpoint: Checkpoint):
+    for tile in region_tiles(lat_min, lat_max, lon_min, lon_max):
+        key = "tile:{},{},{},{}".format(*tile)
+        if key in checkpoint:
+            continue
+        cells = grid_cells(*tile)
+        missing = [cell for cell in cells if not has_power_daily(*cell)]
+        if not missing:
+            checkpoint.mark(key)
+            continue
+
+        print(f"Fetching regional tile {tile} ({len(missing)} cells missing)")
+        wanted = set(missing)
+        per_cell = {}
+        for parameter in POWER_PARAMETERS:
+            series = throttle.call(download_power_regional, parameter, *pad_tile(*tile))
+            if series is None:
+                print(f"Regional fetch failed for {tile}")
+                break
+            for cell, values in series.items():
+                # Padding pulls in cells outside the requested box; keep only ours
+                if cell in wanted:
+                    per_cell.setdefault(cell, {})[parameter] = values
+        else:
+            for (lat, lon), params_data in per_cell.items():
+                if set(params_data) != set(POWER_PARAMETERS):
+                    continue
+                df = power_daily_frame(params_data)
+                if df is not None:
+                    store_power_daily(lat, lon, df)
+
+        # Edge cells whose centres lie outside the box, cells missing from a
+        # parameter's response, or a failed regional fetch: go point by point
+        remaining = [cell for cell in missing if not has_power_daily(*cell)]
+        if remaining:
+            print(f"{len(remaining)} cells of {tile} not covered regionally, falling back to point requests")
+            ingest_power_cells(remaining, throttle, checkpoint)
+        if all(has_power_daily(*cell) for cell in missing):
+            checkpoint.mark(key)
+
+# ------------------------------------------------------------------
+# 4.  Hourly (Open-Meteo archive) ingestion
+# ------------------------------------------------------------------
+def hourly_cells(lat_min: float, lat_max: float, lon_min: float, lon_max: float):
+    """All hourly-store cell centres (HOURLY_STORE_STEP grid) covering the bounding box."""
+    lats = np.arange(round(lat_min / HOURLY_STORE_STEP), round(lat_max / HOURLY_STORE_STEP) + 1) * HOURLY_STORE_STEP
+    lons = np.arange(round(lon_min / HOURLY_STORE_STEP), round(lon_max / HOURLY_STORE_STEP) + 1) * HOURLY_STORE_STEP
+    return [hourly_cell(float(la), float(lo)) for la in lats for lo in lons]
+
+def ingest_hourly_site(lat: float, lon: float, throttle: Throttle, checkpoint: Checkpoint):
+    """Store whole past years so any target date at the site is served locally."""
+    lat, lon = hourly_cell(lat, lon)
+    # Checkpointed per site; the store itself records which years are done
+    key = f"hourly:{lat},{lon}"
+    if key in checkpoint:
+        return
+    last_full_year = date.today().year - 1
+    complete = True
+    for year in range(last_full_year - HOURLY_YEARS_BACK + 1, last_full_year + 1):
+        if has_hourly_year(lat, lon, year):
+            continue
+        df = throttle.call(download_hourly_range, lat, lon, date(year, 1, 1), date(year, 12, 31))
+        if df is None:
+            print(f"No hourly data for {lat},{lon} in {year}; will retry on the next run")
+            complete = False
+            continue
+        store_hourly_year(lat, lon, year, df)
+    if complete:
+        checkpoint.mark(key)
+
+def ingest_sites(sites, hourly: bool, power_throttle: Throttle, hourly_throttle: Throttle, checkpoint: Checkpoint):
+    for i, (lat, lon) in enumerate(sites, start=1):
+        print(f"[{i}/{len(sites)}] {lat},{lon}")
+        ingest_power_cells([power_cell(lat, lon)], power_throttle, checkpoint)
+        if hourly:
+            ingest_hourly_site(lat, lon, hourly_throttle, checkpoint)
+
+def read_sites(path: str):
+    """Sites from a CSV with `lat` and `lon` columns."""
+    sites = pd.read_csv(path)
+    return list(zip(sites["lat"].astype(float), sites["lon"].astype(float)))
+
+# ------------------------------------------------------------------
+# 5.  Command line
+# ------------------------------------------------------------------
+def run(args):
+    power_throttle = Throttle(args.min_interval)
+    hourly_throttle = Throttle(args.min_interval)
+
+    if args.command == "region":
+        job = args.job or "region_{}_{}_{}_{}".format(args.lat_min, args.lat_max, args.lon_min, args.lon_max)
+        checkpoint = Checkpoint(job, restart=args.restart)
+        ingest_power_region(args.lat_min, args.lat_max, args.lon_min, args.lon_max, power_throttle, checkpoint)
+        if args.hourly:
+            sites = hourly_cells(args.lat_min, args.lat_max, args.lon_min, args.lon_max)
+            print(f"Ingesting hourly data for {len(sites)} cells")
+            for lat, lon in sites:
+                ingest_hourly_site(lat, lon, hourly_throttle, checkpoint)
+    elif args.command == "sites":
+        job = args.job or "sites_" + os.path.splitext(os.path.basename(args.path))[0]
+        checkpoint = Checkpoint(job, restart=args.restart)
+        ingest_sites(read_sites(args.path), args.hourly, power_throttle, hourly_throttle, checkpoint)
+    else:
+        # The ranking changes between runs, so scheduled jobs always start fresh
+        checkpoint = Checkpoint(args.job or "top", restart=True)
+        ingest_sites(top_requested_cells(args.n), args.hourly, power_throttle, hourly_throttle, checkpoint)
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--min-interval", type=float, default=2.0, help="seconds between upstream requests")
+    common.add_argument("--job", help="checkpoint name (defaults to one derived from the arguments)")
+    common.add_argument("--restart", action="store_true", help="ignore any existing checkpoint")
+    common.add_argument(
+        "--hourly", action="store_true",
+        help="also ingest 20 years of hourly data for the 0.1 degree cell of each site; for a region, "
+             "every 0.1 degree cell in the box (about 100 cells per square degree, 20 requests each)",
+    )
+
+    parser = argparse.ArgumentParser(description="Pre-ingest weather data into the local data store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    region = sub.add_parser("region", parents=[common], help="every POWER cell in a bounding box")
+    region.add_argument("--lat-min", type=float, required=True)
+    region.add_argument("--lat-max", type=float, required=True)
+    region.add_argument("--lon-min", type=float, required=True)
+    region.add_argument("--lon-max", type=float, required=True)
+
+    sites = sub.add_parser("sites", parents=[common], help="a CSV list of sites with lat/lon columns")
+    sites.add_argument("path")
+
+    top = sub.add_parser("top", parents=[common], help="the N most requested cells")
+    top.add_argument("--n", type=int, default=50)
+    top.add_argument("--every", type=float, help="repeat every N hours instead of running once")
+
+    args = parser.parse_args()
+    while True:
+        run(args)
+        if args.command != "top" or not args.every:
+            break
+        print(f"Sleeping {args.every}h until the next warm-up")
+        time.sleep(args.every * 3600)
+
+if __name__ == "__main__":
+    main()